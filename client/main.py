@@ -1,3 +1,4 @@
+import argparse
 import socket
 import json
 import sys
@@ -6,7 +7,7 @@ import readline
 import random
 import uuid
 from datetime import datetime
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 import time
 
 
@@ -21,20 +22,28 @@ class ChatClient:
         'cyan': '\033[96m'
     }
     RESET = '\033[0m'
+    HEARTBEAT_INTERVAL = 15.0
+    SERVER_TIMEOUT = 45.0
 
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int, unix_path: Optional[str] = None, connection=None):
         self.host = host
         self.port = port
-        self.socket = None
+        self.unix_path = unix_path
+        self.socket = connection
         self.username = None
         self.connected = False
         self.receive_thread = None
         self.send_thread = None
         self.typing_thread = None
+        self.heartbeat_thread = None
+        self.last_received = time.monotonic()
         self.current_input = ""
         self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
         self.color = random.choice(list(self.COLORS.keys()))
         self.known_users: Set[str] = set()
+        self.presence: Dict[str, str] = {}
+        self.presence_version = 0
         self.is_typing = False
         self.last_typing_status = False
         self.unacked_messages = {}
@@ -67,6 +76,7 @@ Available Commands:
 /users    - All active users
 /clear    - Clear the screen
 /color    - Change your color 
+/away     - Toggle your away status
 /dm <user> <message> - Send a direct message (alternative to @user)
 /exclude <user> <message> - Exclude a user from seeing a message (alternative to !user)
 
@@ -78,10 +88,17 @@ Special Message Prefixes:
 
     def connect(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            if self.socket is not None:
+                print('Connected in-process')
+            elif self.unix_path:
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.connect(self.unix_path)
+                print(f'Connected to unix:{self.unix_path}')
+            else:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.connect((self.host, self.port))
+                print(f'Connected to {self.host}:{self.port}')
             self.connected = True
-            print(f'Connected to {self.host}:{self.port}')
             return True
         except ConnectionRefusedError:
             print("Could not connect to server. Is it running?")
@@ -130,6 +147,14 @@ Special Message Prefixes:
                 message_data += chunk
 
             message = json.loads(message_data.decode())
+            self.last_received = time.monotonic()
+
+            if message.get('type') == 'ping':
+                self.send_control({"type": "pong"})
+                return True
+
+            if message.get('type') == 'pong':
+                return True
 
             if message.get('type') == 'ack':
                 message_id = message.get('message_id')
@@ -137,8 +162,9 @@ Special Message Prefixes:
                     del self.unacked_messages[message_id]
                 return True
 
-            if message.get('username'):
-                self.known_users.add(message.get('username'))
+            if message.get('type') == 'presence':
+                self.apply_presence(message)
+                return True
 
             with self.lock:
                 self.clear_current_line()
@@ -163,6 +189,28 @@ Special Message Prefixes:
             self.connected = False
             return False
 
+    def apply_presence(self, message: dict):
+        if message.get('op') == 'snapshot':
+            self.presence = dict(message.get('users', {}))
+            self.presence_version = message.get('version', 0)
+        else:
+            for version, op, username in message.get('changes', []):
+                if version <= self.presence_version:
+                    continue
+                if version != self.presence_version + 1:
+                    self.send_control({"type": "presence_sync", "version": self.presence_version})
+                    break
+                if op == 'leave':
+                    self.presence.pop(username, None)
+                elif op == 'join':
+                    self.presence[username] = 'online'
+                else:
+                    self.presence[username] = op
+                self.presence_version = version
+
+        self.known_users = set(self.presence)
+        self.known_users.discard(self.username)
+
     def validate_target_user(self, target_user: str) -> bool:
         if not target_user:
             print("Invalid username specified")
@@ -171,7 +219,7 @@ Special Message Prefixes:
             print("You cannot target yourself")
             return False
         if target_user not in self.known_users:
-            print(f"Warning: User '{target_user}' has not been seen in the chat")
+            print(f"Warning: User '{target_user}' is not online")
         return True
 
     def process_command(self, message: str) -> bool:
@@ -189,7 +237,14 @@ Special Message Prefixes:
             self.show_help()
             return True
         elif command == '/users':
-            print("Online users:", ", ".join(sorted(self.known_users)))
+            users = [
+                f"{u} (away)" if status == 'away' else u
+                for u, status in sorted(self.presence.items())
+            ]
+            print("Online users:", ", ".join(users))
+            return True
+        elif command == '/away':
+            self.send_message('/away')
             return True
         elif command == '/clear':
             print("\033[H\033[J", end="")
@@ -257,10 +312,7 @@ Special Message Prefixes:
             if not data:
                 return True
 
-            json_data = json.dumps(data).encode()
-            message_length = len(json_data)
-            self.socket.send(message_length.to_bytes(4, 'big'))
-            self.socket.send(json_data)
+            self.send_frame(data)
 
             self.unacked_messages[data['id']] = data
 
@@ -271,6 +323,18 @@ Special Message Prefixes:
             self.connected = False
             return False
 
+    def send_frame(self, data: dict):
+        # The input, typing, receive and heartbeat threads all write; each frame must go out whole.
+        json_data = json.dumps(data).encode()
+        with self.send_lock:
+            self.socket.sendall(len(json_data).to_bytes(4, 'big') + json_data)
+
+    def send_control(self, data: dict):
+        try:
+            self.send_frame(data)
+        except Exception as e:
+            print(f"\nError sending {data.get('type')}: {e}")
+
     def acknowledge_message(self, message_id: str):
         try:
             ack_data = {
@@ -278,10 +342,7 @@ Special Message Prefixes:
                 "message_id": message_id,
                 "username": self.username
             }
-            json_data = json.dumps(ack_data).encode()
-            message_length = len(json_data)
-            self.socket.send(message_length.to_bytes(4, 'big'))
-            self.socket.send(json_data)
+            self.send_frame(ack_data)
         except Exception as e:
             print(f"\nError sending acknowledgment: {e}")
 
@@ -294,15 +355,29 @@ Special Message Prefixes:
                         "username": self.username,
                         "is_typing": self.is_typing
                     }
-                    json_data = json.dumps(data).encode()
-                    message_length = len(json_data)
-                    self.socket.send(message_length.to_bytes(4, 'big'))
-                    self.socket.send(json_data)
+                    self.send_frame(data)
                     self.last_typing_status = self.is_typing
                 except Exception:
                     pass
             time.sleep(0.5)
 
+    def monitor_server(self):
+        last_ping = 0.0
+        while self.connected:
+            time.sleep(1.0)
+            silent_for = time.monotonic() - self.last_received
+            if silent_for >= self.SERVER_TIMEOUT:
+                print(f"\nServer has not responded for {int(silent_for)}s, disconnecting")
+                self.connected = False
+                try:
+                    self.socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                break
+            if silent_for >= self.HEARTBEAT_INTERVAL and time.monotonic() - last_ping >= self.HEARTBEAT_INTERVAL:
+                self.send_control({"type": "ping"})
+                last_ping = time.monotonic()
+
     def receive_loop(self):
         while self.connected:
             if not self.receive_message():
@@ -353,21 +428,23 @@ Special Message Prefixes:
             "color": self.color,
             "timestamp": datetime.now().isoformat()
         }
-        json_data = json.dumps(join_message).encode()
-        self.socket.send(len(json_data).to_bytes(4, 'big'))
-        self.socket.send(json_data)
+        self.last_received = time.monotonic()
+        self.send_frame(join_message)
 
         self.receive_thread = threading.Thread(target=self.receive_loop)
         self.send_thread = threading.Thread(target=self.send_loop)
         self.typing_thread = threading.Thread(target=self.update_typing_status)
+        self.heartbeat_thread = threading.Thread(target=self.monitor_server)
 
         self.receive_thread.daemon = True
         self.send_thread.daemon = True
         self.typing_thread.daemon = True
+        self.heartbeat_thread.daemon = True
 
         self.receive_thread.start()
         self.send_thread.start()
         self.typing_thread.start()
+        self.heartbeat_thread.start()
 
         try:
             self.send_thread.join()
@@ -378,7 +455,12 @@ Special Message Prefixes:
 
 
 def main():
-    client = ChatClient('127.0.0.1', 8080)
+    parser = argparse.ArgumentParser(description="Terminal chat client")
+    parser.add_argument('--unix', metavar='PATH',
+                        help="connect over a unix domain socket instead of TCP (same host only)")
+    args = parser.parse_args()
+
+    client = ChatClient('127.0.0.1', 8080, unix_path=args.unix)
     client.start()
 
 
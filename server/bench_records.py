@@ -0,0 +1,64 @@
+"""Memory used per cached history message: plain dicts versus MessageRecord.
+
+Messages are decoded from JSON frames the way the server receives them, so
+every dict carries its own copy of the username, color and timestamp strings.
+
+    python bench_records.py [count]
+"""
+import json
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from records import MessageRecord
+
+USERNAMES = [f"user{i}" for i in range(50)]
+COLORS = ['red', 'blue', 'green', 'yellow', 'white', 'purple', 'cyan']
+
+
+def incoming_frames(count: int):
+    for i in range(count):
+        yield json.dumps({
+            "id": str(uuid.uuid4()),
+            "type": "message",
+            "username": USERNAMES[i % len(USERNAMES)],
+            "message": f"message number {i} with some ordinary chat text",
+            "color": COLORS[i % len(COLORS)],
+            "timestamp": datetime.now().isoformat(),
+            "target_user": None,
+            "excluded_user": None
+        }).encode()
+
+
+def measure(frames, build) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    history = [build(json.loads(frame)) for frame in frames]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(history)
+
+
+def as_record(data: dict) -> MessageRecord:
+    return MessageRecord.from_dict(data)
+
+
+def as_encoded_record(data: dict) -> MessageRecord:
+    record = MessageRecord.from_dict(data)
+    record.encode()
+    return record
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    frames = list(incoming_frames(count))
+
+    print(f"{count} cached messages")
+    print(f"  dict:                        {measure(frames, lambda data: data):7.1f} bytes/message")
+    print(f"  MessageRecord:               {measure(frames, as_record):7.1f} bytes/message")
+    print(f"  MessageRecord + cached wire: {measure(frames, as_encoded_record):7.1f} bytes/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compare TCP loopback, unix domain socket and in-process memory transports.
+
+For each transport two clients join a fresh server. The benchmark measures
+ping/pong round trips through the server, and relay throughput: one client
+streams typing frames and the other counts them. Neither path touches the
+database, so the numbers reflect transport and framing cost.
+
+    python bench_transports.py [round_trips] [relayed_frames]
+"""
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from main import ChatServer
+
+
+def send(conn, message: dict):
+    json_data = json.dumps(message).encode()
+    conn.sendall(len(json_data).to_bytes(4, 'big') + json_data)
+
+
+def recv_exact(conn, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+def receive(conn) -> dict:
+    length = int.from_bytes(recv_exact(conn, 4), 'big')
+    return json.loads(recv_exact(conn, length).decode())
+
+
+def receive_type(conn, message_type: str) -> dict:
+    while True:
+        message = receive(conn)
+        if message.get('type') == message_type:
+            return message
+
+
+def join(conn, username: str):
+    send(conn, {"type": "join", "username": username})
+    receive_type(conn, 'presence')
+
+
+def run(name: str, connect, round_trips: int, relayed_frames: int):
+    sender, receiver = connect(), connect()
+    join(sender, f"{name}-sender")
+    join(receiver, f"{name}-receiver")
+    send(receiver, {"type": "ping"})
+    receive_type(receiver, 'pong')
+
+    latencies = []
+    for _ in range(round_trips):
+        started = time.perf_counter()
+        send(sender, {"type": "ping"})
+        receive_type(sender, 'pong')
+        latencies.append(time.perf_counter() - started)
+
+    def drain():
+        for _ in range(relayed_frames):
+            receive_type(receiver, 'typing')
+
+    drain_thread = threading.Thread(target=drain)
+    started = time.perf_counter()
+    drain_thread.start()
+    for i in range(relayed_frames):
+        send(sender, {"type": "typing", "is_typing": i % 2 == 0})
+    drain_thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{name:>7}: round trip p50 {statistics.median(latencies) * 1e6:7.1f}us "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f}us, "
+          f"relay {relayed_frames / elapsed:9.0f} frames/s")
+
+    sender.close()
+    receiver.close()
+
+
+def main():
+    round_trips = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    relayed_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        unix_path = os.path.join(workdir, 'chat.sock')
+        server = ChatServer('127.0.0.1', 0)
+        server.add_unix_listener(unix_path)
+        server.start()
+        tcp_address = server.listeners[0].address
+
+        try:
+            run('tcp', lambda: socket.create_connection(tcp_address), round_trips, relayed_frames)
+
+            def connect_unix():
+                conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                conn.connect(unix_path)
+                return conn
+
+            run('unix', connect_unix, round_trips, relayed_frames)
+            run('memory', server.attach, round_trips, relayed_frames)
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import itertools
+import os
+import struct
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+CAPTURE_MAGIC = b'SCHATCAP2\n'
+
+# microseconds since the epoch, session id, connection id, event kind, payload length
+RECORD = struct.Struct('>QIIBI')
+
+SESSION = 0
+CONNECT = 1
+FRAME = 2
+DISCONNECT = 3
+
+
+class CapturedEvent(NamedTuple):
+    timestamp_us: int
+    session: int
+    connection: int
+    kind: int
+    payload: bytes
+
+
+class TrafficCapture:
+    """Append-only recording of the frames clients send to the server.
+
+    Connections are numbered in order of arrival rather than identified by
+    address. Each server run that opens the file starts a new session, so
+    several captures can be appended to one file and replayed in sequence.
+    Records are written unbuffered, each in a single append, and carry the
+    writer's session id, so during a hot restart the old and new process can
+    interleave records in the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab', buffering=0)
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.write(CAPTURE_MAGIC)
+        self.session = os.getpid()
+        self._connection_ids = itertools.count(1)
+        self._write(0, SESSION)
+
+    def _write(self, connection: int, kind: int, payload: bytes = b''):
+        header = RECORD.pack(time.time_ns() // 1000, self.session, connection, kind, len(payload))
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(header + payload)
+
+    def open_connection(self) -> int:
+        connection = next(self._connection_ids)
+        self._write(connection, CONNECT)
+        return connection
+
+    def frame(self, connection: int, payload: bytes):
+        self._write(connection, FRAME, payload)
+
+    def close_connection(self, connection: int):
+        self._write(connection, DISCONNECT)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_capture(path: str) -> Iterator[CapturedEvent]:
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+
+        # Sessions are numbered from 1 in the order they started.
+        sessions = {}
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            timestamp_us, session_id, connection, kind, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            if kind == SESSION:
+                sessions[session_id] = len(sessions) + 1
+            yield CapturedEvent(timestamp_us, sessions.get(session_id, 0), connection, kind, payload)
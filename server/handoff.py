@@ -0,0 +1,80 @@
+import json
+import os
+import socket
+import struct
+from typing import List, Tuple
+
+from transport import remove_stale_socket
+
+HANDOFF_PATH = '/tmp/socketchat.handoff'
+TAKEOVER_REQUEST = b'TAKEOVER'
+TAKEOVER_ACK = b'OK'
+TAKEOVER_DONE = b'GO'
+
+# SCM_RIGHTS is capped at 253 descriptors per message on Linux
+MAX_FDS_PER_MESSAGE = 200
+STATE_CHUNK_SIZE = 64 * 1024
+
+
+def bind_handoff_socket(path: str) -> socket.socket:
+    """Listen for takeover requests on ``path``, replacing it only if it is stale."""
+    remove_stale_socket(path, socket.SOCK_SEQPACKET)
+    handoff_socket = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    handoff_socket.bind(path)
+    # Whoever can connect receives every client socket; nobody can connect before listen().
+    os.chmod(path, 0o600)
+    handoff_socket.listen(1)
+    return handoff_socket
+
+
+def peer_is_same_user(conn: socket.socket) -> bool:
+    """Check the connecting process runs as our user, where the platform reports peer credentials."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', credentials)
+    return uid == os.getuid()
+
+
+def request_takeover(path: str, timeout: float) -> socket.socket:
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    conn.settimeout(timeout)
+    conn.connect(path)
+    conn.send(TAKEOVER_REQUEST)
+    return conn
+
+
+def send_state(conn: socket.socket, state: dict, fds: List[int]):
+    """Send the JSON ``state`` followed by ``fds`` over a SOCK_SEQPACKET connection."""
+    state_data = json.dumps(state).encode()
+    header = {"state_bytes": len(state_data), "fd_count": len(fds)}
+    conn.send(json.dumps(header).encode())
+
+    for offset in range(0, len(state_data), STATE_CHUNK_SIZE):
+        conn.send(state_data[offset:offset + STATE_CHUNK_SIZE])
+
+    for offset in range(0, len(fds), MAX_FDS_PER_MESSAGE):
+        socket.send_fds(conn, [b'F'], fds[offset:offset + MAX_FDS_PER_MESSAGE])
+
+
+def receive_state(conn: socket.socket) -> Tuple[dict, List[int]]:
+    header_data = conn.recv(STATE_CHUNK_SIZE)
+    if not header_data:
+        raise ConnectionError("The old server declined the handoff")
+    header = json.loads(header_data.decode())
+
+    state_data = b''
+    while len(state_data) < header["state_bytes"]:
+        chunk = conn.recv(STATE_CHUNK_SIZE)
+        if not chunk:
+            raise ConnectionError("Handoff connection closed while receiving state")
+        state_data += chunk
+
+    fds: List[int] = []
+    while len(fds) < header["fd_count"]:
+        _, chunk_fds, _, _ = socket.recv_fds(conn, 1, MAX_FDS_PER_MESSAGE)
+        if not chunk_fds:
+            raise ConnectionError("Handoff connection closed while receiving sockets")
+        fds.extend(chunk_fds)
+
+    return json.loads(state_data.decode()), fds
@@ -1,24 +1,74 @@
+import argparse
+import os
+import select
 import socket
 import json
 import threading
 import signal
 import time
 import sqlite3
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
 from datetime import datetime
 
+from capture import TrafficCapture
+from handoff import (
+    HANDOFF_PATH, TAKEOVER_ACK, TAKEOVER_DONE, TAKEOVER_REQUEST,
+    bind_handoff_socket, peer_is_same_user, receive_state, request_takeover, send_state
+)
+from presence import PresenceSet
+from records import MessageRecord
+from timer_wheel import Timer, TimerWheel
+from transport import (
+    UNIX_SOCKET_PATH, MemoryConnection, MemoryListener, SocketListener, set_send_timeout
+)
+
 
 class ChatServer:
+    TIMER_TICK = 0.1
+    PRESENCE_TICK = 0.1
+    HANDSHAKE_TIMEOUT = 10.0
+    HEARTBEAT_INTERVAL = 15.0
+    IDLE_TIMEOUT = 45.0
+    SEND_TIMEOUT = 2.0
+    ACCEPT_TIMEOUT = 1.0
+    HANDOFF_TIMEOUT = 2.0
+    TAKEOVER_TIMEOUT = 10.0
+    HISTORY_LIMIT = 20
+    RELAYED_TYPES = ('typing', 'ack')
+    PING_FRAME = b'\x00\x00\x00\x10{"type": "ping"}'
+
     def __init__(self, host: str, port: int):
         self.host = host
         self.port = port
         self.clients: Dict[socket.socket, str] = {}
-        self.clients_lock = threading.Lock()
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.connections: Dict[socket.socket, threading.Thread] = {}
+        self.send_locks: Dict[socket.socket, threading.Lock] = {}
+        self.clients_lock = threading.RLock()
+        self.memory_listener = MemoryListener()
+        self.listeners: List = [SocketListener.tcp(host, port), self.memory_listener]
         self.running = False
-        self.accept_thread = None
-        self.message_history: List[dict] = []
+        self.accept_threads: Dict[object, threading.Thread] = {}
+        self.presence = PresenceSet()
+        self.wheel = TimerWheel(self.TIMER_TICK)
+        self.timer_thread = None
+        self.presence_timer: Optional[Timer] = None
+        self.presence_thread = None
+        self.presence_due = threading.Event()
+        self.timers_lock = threading.Lock()
+        self.deadlines: Dict[socket.socket, Timer] = {}
+        self.last_activity: Dict[socket.socket, int] = {}
+        self.capture: Optional[TrafficCapture] = None
+        self.capture_ids: Dict[socket.socket, int] = {}
+        self.handoff_socket = None
+        self.handoff_thread = None
+        self.handing_off = False
+        self.handed_off = False
+        self.reading: Set[socket.socket] = set()
+        self.parked: Set[socket.socket] = set()
+        self._wakeup_r = None
+        self._wakeup_w = None
+        self.message_history: Deque[MessageRecord] = deque(maxlen=self.HISTORY_LIMIT)
         self.setup_database(self)
         self.load_recent_messages()
         self.colors = {
@@ -54,24 +104,23 @@ class ChatServer:
             cursor.execute('''
                 SELECT timestamp, username, message, message_type, target_user, color, excluded_user
                 FROM messages 
-                ORDER BY id DESC LIMIT 20
-            ''')
+                ORDER BY id DESC LIMIT ?
+            ''', (self.HISTORY_LIMIT,))
             rows = cursor.fetchall()
 
             for row in reversed(rows):
-                message_data = {
-                    "timestamp": row[0],
-                    "username": row[1],
-                    "message": row[2],
-                    "type": row[3],
-                    "target_user": row[4],
-                    "color": row[5],
-                    "excluded_user": row[6]
-                }
-                self.message_history.append(message_data)
+                self.message_history.append(MessageRecord(
+                    timestamp=row[0],
+                    username=row[1],
+                    message=row[2],
+                    type=row[3],
+                    target_user=row[4],
+                    color=row[5],
+                    excluded_user=row[6]
+                ))
 
     @staticmethod
-    def save_message(message_data: dict):
+    def save_message(record: MessageRecord):
         with sqlite3.connect('chat_history.db') as conn:
             cursor = conn.cursor()
             cursor.execute('''
@@ -81,19 +130,19 @@ class ChatServer:
                 ) VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
                 datetime.now().isoformat(),
-                message_data.get('username', ''),
-                message_data.get('message', ''),
-                message_data.get('type', 'message'),
-                message_data.get('target_user'),
-                message_data.get('color'),
-                message_data.get('excluded_user')
+                record.username or '',
+                record.message,
+                record.type,
+                record.target_user,
+                record.color,
+                record.excluded_user
             ))
             conn.commit()
 
-    def handle_command(self, client_socket: socket.socket, message_data: dict) -> tuple[
-        dict, Optional[str], Optional[str]]:
-        message = message_data.get('message', '')
-        username = message_data.get('username', '')
+    def handle_command(self, client_socket: socket.socket, record: MessageRecord) -> tuple[
+        MessageRecord, Optional[str], Optional[str]]:
+        message = record.message
+        username = record.username
         parts = message.split(maxsplit=2)
         command = parts[0].lower()
 
@@ -101,97 +150,118 @@ class ChatServer:
             raise ConnectionError("Client requested disconnect")
 
         elif command == '/users':
-            with self.clients_lock:
-                active_users = list(self.clients.values())
-            system_message = {
-                "type": "system",
-                "message": f"Active users: {', '.join(sorted(active_users))}",
-                "timestamp": datetime.now().isoformat()
-            }
-            self._send_message(client_socket, system_message)
+            system_message = MessageRecord.system(f"Active users: {', '.join(self.presence.sorted_users())}")
+            self._send_frame(client_socket, system_message.encode())
+            return None, None, None
+
+        elif command == '/away':
+            if self.presence.status(username) == PresenceSet.AWAY:
+                self.presence.set_status(username, PresenceSet.ONLINE)
+            else:
+                self.presence.set_status(username, PresenceSet.AWAY)
             return None, None, None
 
         elif command == '/color':
-            new_color = message_data.get('color', 'white')
-            system_message = {
-                "type": "system",
-                "message": f"{username} changed their color to {new_color}",
-                "timestamp": datetime.now().isoformat()
-            }
+            new_color = record.color or 'white'
+            system_message = MessageRecord.system(f"{username} changed their color to {new_color}")
             self.broadcast(system_message)
             return None, None, None
 
         elif command == '/dm' and len(parts) >= 3:
             target_user = parts[1]
             content = parts[2]
-            message_data['type'] = 'direct'
-            message_data['message'] = content
-            message_data['target_user'] = target_user
-            return message_data, target_user, None
+            return record.replace(type='direct', message=content, target_user=target_user), target_user, None
 
         elif command == '/exclude' and len(parts) >= 3:
             excluded_user = parts[1]
             content = parts[2]
-            message_data['type'] = 'excluded'
-            message_data['message'] = content
-            message_data['excluded_user'] = excluded_user
-            return message_data, None, excluded_user
+            return record.replace(type='excluded', message=content, excluded_user=excluded_user), None, excluded_user
 
-        return self.process_message(message_data)
+        return self.process_message(record)
 
     @staticmethod
-    def process_message(message_data: dict) -> tuple[dict, Optional[str], Optional[str]]:
-        message = message_data.get('message', '')
-        target_user = None
-        excluded_user = None
+    def process_message(record: MessageRecord) -> tuple[MessageRecord, Optional[str], Optional[str]]:
+        message = record.message
 
         if message.startswith('@'):
             parts = message.split(' ', 1)
             if len(parts) > 1:
                 target_user = parts[0][1:]
-                message = parts[1]
-                message_data['type'] = 'direct'
-                message_data['target_user'] = target_user
+                return record.replace(type='direct', message=parts[1], target_user=target_user), target_user, None
 
         elif message.startswith('!'):
             parts = message.split(' ', 1)
             if len(parts) > 1:
                 excluded_user = parts[0][1:]
-                message = parts[1]
-                message_data['type'] = 'excluded'
-                message_data['excluded_user'] = excluded_user
+                return record.replace(type='excluded', message=parts[1], excluded_user=excluded_user), None, excluded_user
 
-        message_data['message'] = message
-        return message_data, target_user, excluded_user
+        return record, None, None
+
+    def enable_capture(self, path: str):
+        """Record every frame clients send to ``path`` for later replay with replay.py."""
+        self.capture = TrafficCapture(path)
+        print(f"Capturing client traffic to {path}")
+
+    def add_unix_listener(self, path: str = UNIX_SOCKET_PATH):
+        """Also accept clients on a unix domain socket; call before ``start``."""
+        self.listeners.insert(-1, SocketListener.unix(path))
+
+    def attach(self) -> MemoryConnection:
+        """Connect an in-process client, such as a bot or test, without going through the network."""
+        return self.memory_listener.connect()
 
     def start(self):
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
+        for listener in self.listeners:
+            listener.open()
+            print(f"Server listening on {listener}")
+        self._start_threads()
+
+    def _start_threads(self):
         self.running = True
-        print(f"Server listening on {self.host}:{self.port}")
-        self.accept_thread = threading.Thread(target=self.accept_connections)
-        self.accept_thread.start()
+        for listener in self.listeners:
+            if listener in self.accept_threads and self.accept_threads[listener].is_alive():
+                continue
+            accept_thread = threading.Thread(target=self.accept_connections, args=(listener,))
+            accept_thread.start()
+            self.accept_threads[listener] = accept_thread
+        if self.presence_timer:
+            self.wheel.cancel(self.presence_timer)
+        self.presence_timer = self.wheel.schedule(self.PRESENCE_TICK, self._presence_tick)
+        if self.timer_thread is None or not self.timer_thread.is_alive():
+            self.timer_thread = threading.Thread(target=self.timer_loop)
+            self.timer_thread.daemon = True
+            self.timer_thread.start()
+        if self.presence_thread is None or not self.presence_thread.is_alive():
+            self.presence_thread = threading.Thread(target=self.presence_loop)
+            self.presence_thread.daemon = True
+            self.presence_thread.start()
+
+    def _start_client_thread(self, client_socket: socket.socket, target, *args):
+        # A peer that stops reading fails the send instead of stalling every broadcast.
+        set_send_timeout(client_socket, self.SEND_TIMEOUT)
+        client_thread = threading.Thread(target=target, args=(client_socket, *args))
+        client_thread.daemon = True
+        with self.clients_lock:
+            self.connections[client_socket] = client_thread
+            self.send_locks.setdefault(client_socket, threading.Lock())
+        client_thread.start()
 
-    def accept_connections(self):
-        while self.running:
+    def accept_connections(self, listener):
+        while self.running and not self.handing_off:
             try:
-                self.server_socket.settimeout(1.0)
+                if not self._wait_readable(listener, self.ACCEPT_TIMEOUT):
+                    continue
                 try:
-                    client_socket, client_address = self.server_socket.accept()
+                    client_socket, client_address = listener.accept(self.ACCEPT_TIMEOUT)
                     print(f"New connection from {client_address}")
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, client_address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
+                    self._start_client_thread(client_socket, self.handle_client, client_address)
                 except socket.timeout:
                     continue
             except Exception as e:
                 if self.running:
                     print(f"Error accepting connection: {e}")
 
-    def broadcast(self, message: dict, sender_socket: socket.socket = None,
+    def broadcast(self, message: MessageRecord, sender_socket: socket.socket = None,
                   target_user: str = None, excluded_user: str = None):
         with self.clients_lock:
             disconnected_clients = []
@@ -200,19 +270,19 @@ class ChatServer:
             for client_socket, username in self.clients.items():
                 should_send= False
 
-                if message.get('type') == 'direct' and target_user:
+                if message.type == 'direct' and target_user:
                     should_send = (username == target_user or username == sender_username)
-                elif message.get('type') == 'excluded' and excluded_user:
+                elif message.type == 'excluded' and excluded_user:
                     should_send = (username != excluded_user)
                 else:
                     should_send = (client_socket != sender_socket)
 
                 if should_send:
                     try:
-                        if (message.get('type') == 'direct' and
+                        if (message.type == 'direct' and
                                 username not in [target_user, sender_username]):
                             continue
-                        self._send_message(client_socket, message)
+                        self._send_frame(client_socket, message.encode())
                     except Exception as e:
                         print(f"Error broadcasting to client {username}: {e}")
                         disconnected_clients.append(client_socket)
@@ -220,64 +290,281 @@ class ChatServer:
             for client_socket in disconnected_clients:
                 self.remove_client(client_socket)
 
+    def relay(self, message: dict, sender_socket: socket.socket):
+        """Pass a transient frame such as typing status to everyone else without storing it."""
+        with self.clients_lock:
+            frame = self._encode_message(message)
+            disconnected_clients = []
+            for client_socket, username in self.clients.items():
+                if client_socket == sender_socket:
+                    continue
+                try:
+                    self._send_frame(client_socket, frame)
+                except Exception as e:
+                    print(f"Error relaying to client {username}: {e}")
+                    disconnected_clients.append(client_socket)
+
+            for client_socket in disconnected_clients:
+                self.remove_client(client_socket)
+
+    def timer_loop(self):
+        started = time.monotonic()
+        start_tick = self.wheel.current_tick
+        while self.running:
+            time.sleep(self.wheel.tick)
+            target_tick = start_tick + int((time.monotonic() - started) / self.wheel.tick)
+            if target_tick > self.wheel.current_tick:
+                self.wheel.advance(target_tick - self.wheel.current_tick)
+
+    def _presence_tick(self):
+        # The timer thread must never block on a socket, so the flush runs on presence_loop.
+        self.presence_due.set()
+        if self.running and not self.handing_off:
+            self.presence_timer = self.wheel.schedule(self.PRESENCE_TICK, self._presence_tick)
+
+    def presence_loop(self):
+        while self.running:
+            if self.presence_due.wait(1.0):
+                self.presence_due.clear()
+                if not self.handing_off:
+                    self.flush_presence()
+
+    def _watch(self, client_socket: socket.socket, delay: float, callback):
+        with self.timers_lock:
+            timer = self.deadlines.pop(client_socket, None)
+            if timer:
+                self.wheel.cancel(timer)
+            self.last_activity[client_socket] = self.wheel.current_tick
+            self.deadlines[client_socket] = self.wheel.schedule(delay, callback, client_socket)
+
+    def _unwatch(self, client_socket: socket.socket):
+        with self.timers_lock:
+            timer = self.deadlines.pop(client_socket, None)
+            if timer:
+                self.wheel.cancel(timer)
+            self.last_activity.pop(client_socket, None)
+
     @staticmethod
-    def _send_message(client_socket: socket.socket, message: dict):
+    def _reap(client_socket: socket.socket):
+        # Safe from any thread without clients_lock: wakes a blocked reader with EOF and a
+        # blocked writer with an error, and the reader removes the client as for any disconnect.
         try:
-            json_data = json.dumps(message).encode()
-            message_length = len(json_data)
-            client_socket.send(message_length.to_bytes(4, 'big'))
-            client_socket.send(json_data)
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # The timer callbacks below run on the wheel thread. They only take timers_lock, which
+    # is never held across I/O, and only send without blocking, so one dead peer cannot
+    # stop every other timer.
+
+    def _handshake_expired(self, client_socket: socket.socket):
+        if client_socket in self.clients or self.handing_off:
+            return
+        with self.timers_lock:
+            if self.deadlines.pop(client_socket, None) is None:
+                return
+        print("Closing connection that did not join in time")
+        self._reap(client_socket)
+
+    def _check_liveness(self, client_socket: socket.socket):
+        username = self.clients.get(client_socket)
+        if username is None or self.handing_off:
+            return
+        with self.timers_lock:
+            timer = self.deadlines.get(client_socket)
+            if timer is None:
+                return
+            idle = (self.wheel.current_tick - self.last_activity.get(client_socket, 0)) * self.wheel.tick
+
+        if idle >= self.IDLE_TIMEOUT:
+            print(f"Client {username} timed out")
+            self._reap(client_socket)
+            return
+
+        if idle >= self.HEARTBEAT_INTERVAL:
+            if not self._send_nowait(client_socket, self.PING_FRAME):
+                print(f"Client {username} is not reading, closing")
+                self._reap(client_socket)
+                return
+            delay = self.HEARTBEAT_INTERVAL
+        else:
+            delay = self.HEARTBEAT_INTERVAL - idle
+        with self.timers_lock:
+            # Unwatched or rewatched meanwhile: leave the new state alone.
+            if self.deadlines.get(client_socket) is timer:
+                self.deadlines[client_socket] = self.wheel.schedule(delay, self._check_liveness, client_socket)
+
+    def flush_presence(self):
+        with self.clients_lock:
+            diff = self.presence.take_pending()
+            if diff is None or not self.clients:
+                return
+            frame = self._encode_message(diff)
+            disconnected_clients = []
+            for client_socket, username in self.clients.items():
+                try:
+                    self._send_frame(client_socket, frame)
+                except Exception as e:
+                    print(f"Error sending presence to client {username}: {e}")
+                    disconnected_clients.append(client_socket)
+
+            for client_socket in disconnected_clients:
+                self.remove_client(client_socket)
+
+    @staticmethod
+    def _encode_message(message: dict) -> bytes:
+        json_data = json.dumps(message).encode()
+        return len(json_data).to_bytes(4, 'big') + json_data
+
+    def _send_frame(self, client_socket: socket.socket, frame: bytes):
+        # The reader, broadcasts and the presence flush all write to a socket; each frame must go out whole.
+        send_lock = self.send_locks.get(client_socket)
+        if send_lock is not None and not send_lock.acquire(timeout=self.SEND_TIMEOUT):
+            raise ConnectionError("Failed to send message: another write to this client is stuck")
+        try:
+            # Each send gives up after SEND_TIMEOUT without progress; a trickle of progress
+            # must not extend that forever, so the frame as a whole gets a deadline too.
+            deadline = time.monotonic() + self.SEND_TIMEOUT
+            remaining = memoryview(frame)
+            while remaining:
+                remaining = remaining[client_socket.send(remaining):]
+                if remaining and time.monotonic() > deadline:
+                    raise TimeoutError("client is not reading")
         except Exception as e:
             raise ConnectionError(f"Failed to send message: {e}")
+        finally:
+            if send_lock is not None:
+                send_lock.release()
+
+    def _send_nowait(self, client_socket: socket.socket, frame: bytes) -> bool:
+        """Send a small frame only if it fits in the send buffer right now; False means the peer is not reading."""
+        send_lock = self.send_locks.get(client_socket)
+        if send_lock is not None and not send_lock.acquire(blocking=False):
+            # Another frame is going out; the peer gets traffic either way.
+            return True
+        try:
+            return client_socket.send(frame, getattr(socket, 'MSG_DONTWAIT', 0)) == len(frame)
+        except OSError:
+            return False
+        finally:
+            if send_lock is not None:
+                send_lock.release()
+
+    def _send_message(self, client_socket: socket.socket, message: dict):
+        self._send_frame(client_socket, self._encode_message(message))
 
     @staticmethod
     def _receive_message(client_socket: socket.socket) -> dict:
+        return ChatServer._decode_message(ChatServer._receive_frame(client_socket))
+
+    @staticmethod
+    def _decode_message(frame: bytes) -> dict:
         try:
-            client_socket.settimeout(300.0)
-            message_length_bytes = client_socket.recv(4)
-            if not message_length_bytes:
-                raise ConnectionError("Client disconnected")
-
-            message_length = int.from_bytes(message_length_bytes, 'big')
-            if message_length > 1024 * 1024:
-                raise ValueError("Message too large")
-
-            client_data = b''
-            while len(client_data) < message_length:
-                remaining_bytes = message_length - len(client_data)
-                chunk = client_socket.recv(min(remaining_bytes, 1024))
-                if not chunk:
-                    raise ConnectionError("Connection broken")
-                client_data += chunk
-
-            return json.loads(client_data.decode())
+            return json.loads(frame.decode())
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid message format: {e}")
-        finally:
-            client_socket.settimeout(None)
+
+    def _read_message(self, client_socket: socket.socket) -> dict:
+        frame = self._receive_frame(client_socket)
+        capture_id = self.capture_ids.get(client_socket)
+        if capture_id is not None:
+            self.capture.frame(capture_id, frame)
+        return self._decode_message(frame)
+
+    @staticmethod
+    def _receive_frame(client_socket: socket.socket) -> bytes:
+        message_length_bytes = client_socket.recv(4)
+        if not message_length_bytes:
+            raise ConnectionError("Client disconnected")
+        while len(message_length_bytes) < 4:
+            chunk = client_socket.recv(4 - len(message_length_bytes))
+            if not chunk:
+                raise ConnectionError("Connection broken")
+            message_length_bytes += chunk
+
+        message_length = int.from_bytes(message_length_bytes, 'big')
+        if message_length > 1024 * 1024:
+            raise ValueError("Message too large")
+
+        client_data = b''
+        while len(client_data) < message_length:
+            remaining_bytes = message_length - len(client_data)
+            chunk = client_socket.recv(min(remaining_bytes, 1024))
+            if not chunk:
+                raise ConnectionError("Connection broken")
+            client_data += chunk
+
+        return client_data
 
     def remove_client(self, client_socket: socket.socket):
         with self.clients_lock:
             if client_socket in self.clients:
                 username = self.clients[client_socket]
                 del self.clients[client_socket]
+                self.presence.leave(username)
+                self._reap(client_socket)
                 try:
                     client_socket.close()
                 except:
                     pass
                 print(f"Client {username} disconnected")
-                leave_message = {
-                    "type": "system",
-                    "message": f"{username} has left the chat",
-                    "timestamp": datetime.now().isoformat()
-                }
+                leave_message = MessageRecord.system(f"{username} has left the chat")
                 self.broadcast(leave_message)
                 self.save_message(leave_message)
                 self.message_history.append(leave_message)
 
+    def _wait_readable(self, sock, timeout: Optional[float] = None) -> bool:
+        """Wait until ``sock`` is readable; False means the wait timed out or a handoff started first.
+
+        poll() rather than select(), which cannot watch descriptors past FD_SETSIZE.
+        Without a handoff socket there is nothing to wake for, so this returns at once.
+        """
+        if self._wakeup_r is None or sock.fileno() < 0:
+            return not self.handing_off
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        poller.register(self._wakeup_r, select.POLLIN)
+        ready = poller.poll(None if timeout is None else timeout * 1000)
+        return bool(ready) and not self.handing_off
+
+    def _next_message(self, client_socket: socket.socket) -> Optional[dict]:
+        """Read the next message; None means the connection was parked for a handoff and the caller must stop reading."""
+        while not self._wait_readable(client_socket):
+            with self.clients_lock:
+                if self.handing_off:
+                    self.parked.add(client_socket)
+                    return None
+            # The handoff was aborted before this reader parked; carry on.
+        self.reading.add(client_socket)
+        try:
+            return self._read_message(client_socket)
+        finally:
+            self.reading.discard(client_socket)
+
+    def _release_connection(self, client_socket: socket.socket):
+        with self.clients_lock:
+            if client_socket in self.parked:
+                return
+        self._drop_connection(client_socket)
+
+    def _drop_connection(self, client_socket: socket.socket):
+        with self.clients_lock:
+            self.connections.pop(client_socket, None)
+            self.send_locks.pop(client_socket, None)
+        capture_id = self.capture_ids.pop(client_socket, None)
+        if capture_id is not None:
+            self.capture.close_connection(capture_id)
+        self._unwatch(client_socket)
+        self.remove_client(client_socket)
+
     def handle_client(self, client_socket: socket.socket, client_address):
+        self._watch(client_socket, self.HANDSHAKE_TIMEOUT, self._handshake_expired)
+        if self.capture is not None:
+            self.capture_ids[client_socket] = self.capture.open_connection()
         try:
-            initial_message = self._receive_message(client_socket)
+            initial_message = self._next_message(client_socket)
+            if initial_message is None:
+                return
             username = initial_message.get("username")
 
             if not username:
@@ -292,65 +579,313 @@ class ChatServer:
                     client_socket.close()
                     return
                 self.clients[client_socket] = username
+                self.presence.join(username)
+                self._send_message(client_socket, self.presence.snapshot())
 
             filtered_history = [
                 msg for msg in self.message_history
-                if (not msg.get('type') == 'direct' or
-                    msg.get('target_user') == username or
-                    msg.get('username') == username) and
-                   (not msg.get('type') == 'excluded' or
-                    msg.get('excluded_user') != username)
+                if (not msg.type == 'direct' or
+                    msg.target_user == username or
+                    msg.username == username) and
+                   (not msg.type == 'excluded' or
+                    msg.excluded_user != username)
             ]
             for message in filtered_history:
-                self._send_message(client_socket, message)
+                self._send_frame(client_socket, message.encode())
 
-            join_message = {
-                "type": "system",
-                "message": f"{username} has joined the chat",
-                "timestamp": datetime.now().isoformat()
-            }
+            join_message = MessageRecord.system(f"{username} has joined the chat")
             self.broadcast(join_message)
             self.save_message(join_message)
             self.message_history.append(join_message)
 
-            while self.running:
-                try:
-                    message_data = self._receive_message(client_socket)
-                    message_data["username"] = username
+            self._watch(client_socket, self.HEARTBEAT_INTERVAL, self._check_liveness)
+            self.client_loop(client_socket, username)
 
-                    if message_data.get('message', '').startswith('/'):
-                        processed_data = self.handle_command(client_socket, message_data)
-                        if processed_data is None:
-                            continue
-                        processed_message, target_user, excluded_user = processed_data
-                    else:
-                        processed_message, target_user, excluded_user = self.process_message(message_data)
+        except Exception as e:
+            print(f"Error handling client {client_address}: {e}")
+        finally:
+            self._release_connection(client_socket)
+
+    def resume_client(self, client_socket: socket.socket, username: str):
+        self._watch(client_socket, self.HEARTBEAT_INTERVAL, self._check_liveness)
+        if self.capture is not None:
+            # Adopted mid-session: record the join so a replay can log this user in.
+            capture_id = self.capture.open_connection()
+            self.capture.frame(capture_id, json.dumps({"type": "join", "username": username}).encode())
+            self.capture_ids[client_socket] = capture_id
+        try:
+            self.client_loop(client_socket, username)
+        finally:
+            self._release_connection(client_socket)
 
-                    if processed_message:
-                        self.message_history.append(processed_message)
-                        self.save_message(processed_message)
+    def client_loop(self, client_socket: socket.socket, username: str):
+        while self.running:
+            try:
+                message_data = self._next_message(client_socket)
+                if message_data is None:
+                    return
+                self.last_activity[client_socket] = self.wheel.current_tick
+                message_data["username"] = username
 
-                        if len(self.message_history) > 20:
-                            self.message_history.pop(0)
+                if message_data.get('type') == 'pong':
+                    continue
 
-                        print(f"{username}: {processed_message.get('message', '')}")
-                        self.broadcast(processed_message, client_socket, target_user, excluded_user)
+                if message_data.get('type') == 'ping':
+                    with self.clients_lock:
+                        self._send_message(client_socket, {"type": "pong"})
+                    continue
 
-                except ConnectionError:
-                    break
-                except Exception as e:
-                    print(f"Error handling message from {username}: {e}")
-                    break
+                if message_data.get('type') == 'presence_sync':
+                    sync_message = self.presence.sync_message(int(message_data.get('version', 0)))
+                    with self.clients_lock:
+                        self._send_message(client_socket, sync_message)
+                    continue
 
-        except Exception as e:
-            print(f"Error handling client {client_address}: {e}")
+                if message_data.get('type') in self.RELAYED_TYPES:
+                    self.relay(message_data, client_socket)
+                    continue
+
+                record = MessageRecord.from_dict(message_data, username)
+                if record.message.startswith('/'):
+                    processed_data = self.handle_command(client_socket, record)
+                    if processed_data is None:
+                        continue
+                    processed_message, target_user, excluded_user = processed_data
+                else:
+                    processed_message, target_user, excluded_user = self.process_message(record)
+
+                if processed_message:
+                    self.message_history.append(processed_message)
+                    self.save_message(processed_message)
+
+                    print(f"{username}: {processed_message.message}")
+                    self.broadcast(processed_message, client_socket, target_user, excluded_user)
+
+            except ConnectionError:
+                break
+            except Exception as e:
+                print(f"Error handling message from {username}: {e}")
+                break
+
+    def listen_for_handoff(self, path: str = HANDOFF_PATH):
+        """Accept takeover requests on ``path``; call before ``start`` so every reader can be woken."""
+        self.handoff_socket = bind_handoff_socket(path)
+        if self._wakeup_r is None:
+            self._wakeup_r, self._wakeup_w = os.pipe()
+        self.handoff_thread = threading.Thread(target=self.handoff_loop)
+        self.handoff_thread.daemon = True
+        self.handoff_thread.start()
+        print(f"Accepting hot-restart handoff on {path}")
+
+    def handoff_loop(self):
+        while not self.handed_off:
+            try:
+                conn, _ = self.handoff_socket.accept()
+            except OSError:
+                break
+            with conn:
+                try:
+                    if not peer_is_same_user(conn):
+                        print("Refusing handoff to a process owned by another user")
+                        continue
+                    conn.settimeout(self.HANDOFF_TIMEOUT)
+                    if conn.recv(len(TAKEOVER_REQUEST)) != TAKEOVER_REQUEST:
+                        continue
+                    if self.hand_off(conn):
+                        break
+                except OSError as e:
+                    print(f"Handoff request failed: {e}")
+
+    def _quiesce(self) -> bool:
+        """Stop accepting and park every reader between frames; False means the handoff was abandoned."""
+        deadline = time.monotonic() + self.HANDOFF_TIMEOUT
+
+        def remaining() -> float:
+            return max(0.0, deadline - time.monotonic())
+
+        if not self.clients_lock.acquire(timeout=remaining()):
+            print("Handoff abandoned: the client table stayed locked")
+            return False
+        try:
+            # In-process connections cannot follow us into the new process.
+            for conn in [conn for conn in self.connections if conn.fileno() < 0]:
+                self._drop_connection(conn)
+                conn.close()
+            self.handing_off = True
+            os.write(self._wakeup_w, b'x')
         finally:
-            self.remove_client(client_socket)
+            self.clients_lock.release()
+        self.memory_listener.wake()
+
+        for accept_thread in self.accept_threads.values():
+            accept_thread.join(remaining())
+        if not self.clients_lock.acquire(timeout=remaining()):
+            return self._abandon_handoff("the client table stayed locked")
+        try:
+            threads = list(self.connections.items())
+        finally:
+            self.clients_lock.release()
+        for _, thread in threads:
+            thread.join(remaining())
+
+        stuck = [(client_socket, thread) for client_socket, thread in threads if thread.is_alive()]
+        if any(client_socket not in self.reading for client_socket, _ in stuck):
+            return self._abandon_handoff("a client thread is blocked outside a read")
+        for client_socket, thread in stuck:
+            # Stuck mid-frame: the rest of its bytes cannot be split between two processes.
+            # Shutting its own socket down wakes the reader, which drops the client itself.
+            print("Dropping connection that did not finish its frame before the handoff")
+            self._reap(client_socket)
+        for client_socket, thread in stuck:
+            thread.join(self.ACCEPT_TIMEOUT)
+            if thread.is_alive():
+                return self._abandon_handoff("a dropped connection did not stop")
+        if any(accept_thread.is_alive() for accept_thread in self.accept_threads.values()):
+            return self._abandon_handoff("an accept loop did not stop")
+
+        self.flush_presence()
+        return True
+
+    def _abandon_handoff(self, reason: str) -> bool:
+        print(f"Handoff abandoned, resuming: {reason}")
+        self._resume()
+        return False
+
+    def _resume(self):
+        with self.clients_lock:
+            os.read(self._wakeup_r, 1)
+            self.handing_off = False
+            self._start_threads()
+            for client_socket in self.parked:
+                username = self.clients.get(client_socket)
+                if username:
+                    self._start_client_thread(client_socket, self.resume_client, username)
+                else:
+                    self._start_client_thread(client_socket, self.handle_client, client_socket.getpeername())
+            self.parked.clear()
+
+    def hand_off(self, conn: socket.socket) -> bool:
+        """Pass the listening socket and every live connection to the process on ``conn``."""
+        started = time.monotonic()
+        if not self._quiesce():
+            return False
+
+        socket_listeners = [listener for listener in self.listeners if listener.fileno() >= 0]
+        with self.clients_lock:
+            connections = [conn for conn in self.connections if conn.fileno() >= 0]
+            presence = self.presence.snapshot()
+            state = {
+                "listeners": len(socket_listeners),
+                "clients": [self.clients.get(client_socket) for client_socket in connections],
+                "presence": {"version": presence["version"], "users": presence["users"]},
+                "history": [record.to_dict() for record in self.message_history]
+            }
+            fds = [listener.fileno() for listener in socket_listeners]
+            fds += [client_socket.fileno() for client_socket in connections]
+
+        try:
+            send_state(conn, state, fds)
+            if conn.recv(len(TAKEOVER_ACK)) != TAKEOVER_ACK:
+                raise ConnectionError("Takeover was not acknowledged")
+        except Exception as e:
+            print(f"Handoff failed, resuming: {e}")
+            self._resume()
+            return False
+
+        # Committed: the new process only starts serving once it reads TAKEOVER_DONE,
+        # so the two never read the same sockets at once.
+        self.handed_off = True
+        self.running = False
+        try:
+            conn.send(TAKEOVER_DONE)
+        except OSError as e:
+            print(f"Could not confirm the handoff: {e}")
+        if self.capture is not None:
+            # The new process records these connections again in its own session.
+            for capture_id in self.capture_ids.values():
+                self.capture.close_connection(capture_id)
+            self.capture_ids.clear()
+        elapsed_ms = (time.monotonic() - started) * 1000
+        print(f"Handed off {len(connections)} connections in {elapsed_ms:.1f}ms")
+        return True
+
+    def take_over(self, path: str = HANDOFF_PATH):
+        """Adopt the listening socket and connections of the server running on ``path``."""
+        started = time.monotonic()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        with request_takeover(path, self.TAKEOVER_TIMEOUT) as conn:
+            state, fds = receive_state(conn)
+            listener_count = state["listeners"]
+            sockets: List[socket.socket] = []
+            try:
+                for fd in fds:
+                    sockets.append(socket.socket(fileno=fd))
+                for listener in self.listeners:
+                    if listener is not self.memory_listener:
+                        listener.close(unlink=False)
+                self.listeners = [SocketListener(sock) for sock in sockets[:listener_count]]
+                self.listeners.append(self.memory_listener)
+                self.message_history = deque(
+                    (MessageRecord.from_dict(message) for message in state["history"]),
+                    maxlen=self.HISTORY_LIMIT
+                )
+                self.presence.restore(state["presence"]["version"], state["presence"]["users"])
+                adopted = list(zip(state["clients"], sockets[listener_count:]))
+                conn.send(TAKEOVER_ACK)
+                # The old process may have given up waiting for the ACK and resumed.
+                conn.settimeout(None)
+                if conn.recv(len(TAKEOVER_DONE)) != TAKEOVER_DONE:
+                    raise ConnectionError("The old server resumed instead of handing off")
+            except Exception:
+                # The old process resumes serving these sockets, so drop our
+                # descriptors without notifying anyone or unlinking.
+                for sock in sockets:
+                    sock.close()
+                for fd in fds[len(sockets):]:
+                    os.close(fd)
+                self.listeners = [self.memory_listener]
+                raise
+
+        with self.clients_lock:
+            self._start_threads()
+            for username, client_socket in adopted:
+                if username:
+                    self.clients[client_socket] = username
+                    self._start_client_thread(client_socket, self.resume_client, username)
+                else:
+                    self._start_client_thread(client_socket, self.handle_client, client_socket.getpeername())
+
+        os.unlink(path)
+        self.listen_for_handoff(path)
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        listening_on = ', '.join(str(listener) for listener in self.listeners)
+        print(f"Took over {len(fds) - listener_count} connections on {listening_on} in {elapsed_ms:.1f}ms")
 
     def shutdown(self):
         print("\nShutting down server...")
         self.running = False
 
+        if self.handoff_socket:
+            try:
+                self.handoff_socket.close()
+            except:
+                pass
+
+        if self.capture:
+            self.capture.close()
+
+        if self.handed_off:
+            # The new process owns these sockets now; only drop our descriptors.
+            with self.clients_lock:
+                for client_socket in list(self.connections.keys()):
+                    client_socket.close()
+                self.clients.clear()
+                self.connections.clear()
+            for listener in self.listeners:
+                listener.close(unlink=False)
+            return
+
         with self.clients_lock:
             for client_socket in list(self.clients.keys()):
                 try:
@@ -363,16 +898,30 @@ class ChatServer:
                     pass
             self.clients.clear()
 
-        try:
-            self.server_socket.close()
-        except:
-            pass
-        if self.accept_thread:
-            self.accept_thread.join()
+        for listener in self.listeners:
+            try:
+                listener.close()
+            except:
+                pass
+        for accept_thread in self.accept_threads.values():
+            accept_thread.join()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Terminal chat server")
+    parser.add_argument('--takeover', action='store_true',
+                        help="take over the sockets of the server already running (hot restart)")
+    parser.add_argument('--unix-socket', default=UNIX_SOCKET_PATH,
+                        help="also accept local clients on this unix socket ('' to disable)")
+    parser.add_argument('--handoff-socket', default=HANDOFF_PATH,
+                        help="unix socket used to hand off connections between server processes")
+    parser.add_argument('--capture', metavar='PATH',
+                        help="append every frame clients send to PATH for replay.py")
+    args = parser.parse_args()
+
     server = ChatServer('127.0.0.1', 8080)
+    if args.capture:
+        server.enable_capture(args.capture)
 
     def signal_handler():
         server.shutdown()
@@ -381,7 +930,14 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
 
     try:
-        server.start()
+        if args.takeover:
+            server.take_over(args.handoff_socket)
+        else:
+            if hasattr(socket, 'AF_UNIX') and args.unix_socket:
+                server.add_unix_listener(args.unix_socket)
+            if hasattr(socket, 'send_fds'):
+                server.listen_for_handoff(args.handoff_socket)
+            server.start()
         while server.running:
             time.sleep(0.1)
     except Exception as e:
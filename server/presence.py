@@ -0,0 +1,109 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class PresenceSet:
+    """Versioned set of online users.
+
+    Every join, leave or status change bumps ``version`` and is appended to a
+    bounded change log, so a client that knows its last version can be brought
+    up to date with just the changes it missed instead of the full list.
+    """
+
+    ONLINE = 'online'
+    AWAY = 'away'
+
+    def __init__(self, log_size: int = 4096):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.members: Dict[str, str] = {}
+        self.log: Deque[Tuple[int, str, str]] = deque(maxlen=log_size)
+        self.flushed_version = 0
+        self._sorted_users: Optional[List[str]] = None
+        self._sorted_version = -1
+
+    def _record(self, op: str, username: str):
+        self.version += 1
+        self.log.append((self.version, op, username))
+
+    def join(self, username: str):
+        with self.lock:
+            self.members[username] = self.ONLINE
+            self._record('join', username)
+
+    def leave(self, username: str):
+        with self.lock:
+            if self.members.pop(username, None) is not None:
+                self._record('leave', username)
+
+    def set_status(self, username: str, status: str) -> bool:
+        with self.lock:
+            if self.members.get(username) in (None, status):
+                return False
+            self.members[username] = status
+            self._record(status, username)
+            return True
+
+    def restore(self, version: int, members: Dict[str, str]):
+        with self.lock:
+            self.version = version
+            self.flushed_version = version
+            self.members = dict(members)
+            self.log.clear()
+
+    def status(self, username: str) -> Optional[str]:
+        with self.lock:
+            return self.members.get(username)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "type": "presence",
+                "op": "snapshot",
+                "version": self.version,
+                "users": dict(self.members)
+            }
+
+    def sorted_users(self) -> List[str]:
+        with self.lock:
+            if self._sorted_version != self.version:
+                self._sorted_users = sorted(self.members)
+                self._sorted_version = self.version
+            return self._sorted_users
+
+    def changes_since(self, version: int) -> Optional[List[list]]:
+        """Changes after ``version``, or None if the log no longer reaches back that far."""
+        with self.lock:
+            if version > self.version:
+                return None
+            if version == self.version:
+                return []
+            if not self.log or self.log[0][0] > version + 1:
+                return None
+            return [list(change) for change in self.log if change[0] > version]
+
+    def take_pending(self) -> Optional[dict]:
+        """Diff of everything recorded since the last call, or None if nothing changed."""
+        with self.lock:
+            if self.flushed_version == self.version:
+                return None
+            changes = [list(change) for change in self.log if change[0] > self.flushed_version]
+            self.flushed_version = self.version
+            return {
+                "type": "presence",
+                "op": "diff",
+                "version": self.version,
+                "changes": changes
+            }
+
+    def sync_message(self, version: int) -> dict:
+        changes = self.changes_since(version)
+        if changes is None:
+            return self.snapshot()
+        return {
+            "type": "presence",
+            "op": "diff",
+            "version": version + len(changes),
+            "changes": changes
+        }
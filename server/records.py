@@ -0,0 +1,93 @@
+import json
+import sys
+from datetime import datetime
+from typing import Optional
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+def _parse_timestamp(value) -> int:
+    """Milliseconds since the epoch from an ISO string, falling back to now."""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return int(datetime.now().timestamp() * 1000)
+
+
+class MessageRecord:
+    """Immutable chat message as kept in history and sent to clients.
+
+    Usernames, colors and types are interned so the many records from one
+    user share a single string, the timestamp is an int of milliseconds, and
+    the length-prefixed wire frame is built on first use and then reused for
+    every broadcast and history replay.
+    """
+
+    __slots__ = ('id', 'type', 'username', 'message', 'color', 'timestamp',
+                 'target_user', 'excluded_user', '_frame')
+
+    def __init__(self, type: str, message: str, username: Optional[str] = None,
+                 color: Optional[str] = None, timestamp=None, target_user: Optional[str] = None,
+                 excluded_user: Optional[str] = None, id: Optional[str] = None):
+        init = object.__setattr__
+        init(self, 'id', id)
+        init(self, 'type', sys.intern(type))
+        init(self, 'username', _intern(username))
+        init(self, 'message', message)
+        init(self, 'color', _intern(color))
+        init(self, 'timestamp', _parse_timestamp(timestamp))
+        init(self, 'target_user', _intern(target_user))
+        init(self, 'excluded_user', _intern(excluded_user))
+        init(self, '_frame', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MessageRecord is immutable")
+
+    def __repr__(self):
+        return f"MessageRecord(type={self.type!r}, username={self.username!r}, message={self.message!r})"
+
+    @classmethod
+    def from_dict(cls, data: dict, username: Optional[str] = None) -> 'MessageRecord':
+        return cls(
+            type=data.get('type') or 'message',
+            message=data.get('message') or '',
+            username=username if username is not None else data.get('username'),
+            color=data.get('color'),
+            timestamp=data.get('timestamp'),
+            target_user=data.get('target_user'),
+            excluded_user=data.get('excluded_user'),
+            id=data.get('id')
+        )
+
+    @classmethod
+    def system(cls, message: str) -> 'MessageRecord':
+        return cls(type='system', message=message)
+
+    def replace(self, **changes) -> 'MessageRecord':
+        fields = {name: getattr(self, name) for name in self.__slots__[:-1]}
+        fields.update(changes)
+        return MessageRecord(**fields)
+
+    @property
+    def iso_timestamp(self) -> str:
+        return datetime.fromtimestamp(self.timestamp / 1000).isoformat(timespec='milliseconds')
+
+    def to_dict(self) -> dict:
+        data = {"type": self.type, "message": self.message, "timestamp": self.iso_timestamp}
+        for name in ('id', 'username', 'color', 'target_user', 'excluded_user'):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def encode(self) -> bytes:
+        frame = self._frame
+        if frame is None:
+            json_data = json.dumps(self.to_dict()).encode()
+            frame = len(json_data).to_bytes(4, 'big') + json_data
+            object.__setattr__(self, '_frame', frame)
+        return frame
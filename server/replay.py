@@ -0,0 +1,199 @@
+"""Replay a traffic capture against a fresh ChatServer and report throughput and latency.
+
+Record traffic with ``python main.py --capture traffic.cap``, then:
+
+    python replay.py traffic.cap                 # recorded pace
+    python replay.py traffic.cap --speed 10      # ten times faster
+    python replay.py traffic.cap --speed 0       # as fast as possible
+
+Each captured connection gets its own client connection to the new server.
+Latency is measured from sending a chat message to its first delivery to
+another connection.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from capture import CONNECT, DISCONNECT, FRAME, SESSION, read_capture
+from main import ChatServer
+
+
+def load_events(path: str) -> List[Tuple[int, tuple, int, bytes]]:
+    """Captured events as (microseconds from start, connection key, kind, payload).
+
+    Idle time before each session starts is cut out, so separate server runs
+    play back to back while the overlapping sessions of a hot restart keep
+    their recorded interleaving.
+    """
+    events = []
+    skipped = None
+    last = 0
+    for event in read_capture(path):
+        if skipped is None:
+            skipped = event.timestamp_us
+        elif event.kind == SESSION and event.timestamp_us > last:
+            skipped += event.timestamp_us - last
+        last = max(last, event.timestamp_us)
+        if event.kind != SESSION:
+            events.append((event.timestamp_us - skipped, (event.session, event.connection), event.kind, event.payload))
+    return events
+
+
+class Replay:
+    def __init__(self, connect, speed: float):
+        self.connect = connect
+        self.speed = speed
+        self.connections: Dict[tuple, object] = {}
+        self.readers: Dict[tuple, threading.Thread] = {}
+        self.lock = threading.Lock()
+        self.sent_at: Dict[str, Tuple[float, tuple]] = {}
+        self.latencies: List[float] = []
+        self.connection_count = 0
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.messages_sent = 0
+        self.last_delivery = 0.0
+
+    def run(self, events) -> float:
+        started = time.perf_counter()
+        for at, key, kind, payload in events:
+            if self.speed > 0:
+                delay = started + at / 1e6 / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if kind == CONNECT:
+                conn = self.connect()
+                self.connections[key] = conn
+                self.connection_count += 1
+                reader = threading.Thread(target=self.read, args=(conn, key), daemon=True)
+                reader.start()
+                self.readers[key] = reader
+            elif kind == FRAME:
+                self.send(key, payload)
+            elif kind == DISCONNECT:
+                conn = self.connections.pop(key, None)
+                if conn is not None:
+                    self.disconnect(key, conn)
+        sends_done = time.perf_counter()
+
+        deadline = sends_done + 2.0
+        while self.sent_at and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        for conn in self.connections.values():
+            conn.close()
+        return max(sends_done, self.last_delivery) - started
+
+    def disconnect(self, key: tuple, conn):
+        # Wait until the server has dropped the user, or a hot restart's re-join of the same name is refused.
+        try:
+            conn.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        reader = self.readers.pop(key, None)
+        if reader is not None:
+            reader.join(1.0)
+        conn.close()
+
+    def send(self, key: tuple, payload: bytes):
+        conn = self.connections.get(key)
+        if conn is None:
+            return
+        if b'"id"' in payload:
+            message_id = json.loads(payload.decode()).get('id')
+            if message_id:
+                with self.lock:
+                    self.sent_at[message_id] = (time.perf_counter(), key)
+                    self.messages_sent += 1
+        try:
+            conn.sendall(len(payload).to_bytes(4, 'big') + payload)
+            self.frames_sent += 1
+        except OSError:
+            self.connections.pop(key, None)
+
+    def read(self, conn, key: tuple):
+        while True:
+            try:
+                frame = ChatServer._receive_frame(conn)
+            except (ConnectionError, OSError, ValueError):
+                return
+            received_at = time.perf_counter()
+            with self.lock:
+                self.frames_received += 1
+            if b'"id"' not in frame:
+                continue
+            message_id = json.loads(frame.decode()).get('id')
+            with self.lock:
+                sent = self.sent_at.get(message_id)
+                # Direct messages are echoed to their sender; only delivery to someone else counts.
+                if sent is not None and sent[1] != key:
+                    del self.sent_at[message_id]
+                    self.latencies.append(received_at - sent[0])
+                    self.last_delivery = received_at
+
+    def report(self, elapsed: float):
+        print(f"Replayed {self.connection_count} connections, {self.frames_sent} frames in {elapsed:.2f}s")
+        print(f"  throughput: {self.frames_sent / elapsed:.0f} frames/s in, "
+              f"{self.frames_received / elapsed:.0f} frames/s out")
+        print(f"  delivered:  {len(self.latencies)} of {self.messages_sent} chat messages")
+        if self.latencies:
+            latencies = sorted(self.latencies)
+
+            def percentile(p: float) -> float:
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+            print(f"  latency:    p50 {statistics.median(latencies) * 1000:.2f}ms  p95 {percentile(0.95):.2f}ms  "
+                  f"p99 {percentile(0.99):.2f}ms  max {latencies[-1] * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured chat traffic against a fresh server")
+    parser.add_argument('capture', help="file written by main.py --capture")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="playback speed multiplier; 0 replays as fast as possible")
+    parser.add_argument('--transport', choices=('tcp', 'unix', 'memory'), default='tcp')
+    args = parser.parse_args()
+
+    events = load_events(os.path.abspath(args.capture))
+
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, 'w') as devnull:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(devnull):
+            server = ChatServer('127.0.0.1', 0)
+            unix_path = os.path.join(workdir, 'chat.sock')
+            if args.transport == 'unix':
+                server.add_unix_listener(unix_path)
+            server.start()
+
+        if args.transport == 'tcp':
+            address = server.listeners[0].address
+
+            def connect():
+                return socket.create_connection(address)
+        elif args.transport == 'unix':
+            def connect():
+                conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                conn.connect(unix_path)
+                return conn
+        else:
+            connect = server.attach
+
+        replay = Replay(connect, args.speed)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                elapsed = replay.run(events)
+        finally:
+            with contextlib.redirect_stdout(devnull):
+                server.shutdown()
+        replay.report(elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import threading
+from typing import Callable, Dict, List
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'args', 'slot')
+
+    def __init__(self, deadline: int, callback: Callable, args: tuple, slot: int):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.slot = slot
+
+
+class TimerWheel:
+    """Hashed timer wheel with O(1) schedule and cancel.
+
+    Time advances in whole ticks. A timer lives in the slot for its deadline
+    tick modulo the wheel size, so each advance only looks at one slot; timers
+    more than a full turn away stay in their slot until their deadline comes
+    round. ``current_tick`` is a plain int that readers can stamp activity
+    with instead of asking the clock.
+    """
+
+    def __init__(self, tick: float = 0.1, size: int = 512):
+        self.tick = tick
+        self.size = size
+        self.current_tick = 0
+        self.slots: List[Dict[Timer, None]] = [{} for _ in range(size)]
+        self.lock = threading.Lock()
+
+    def ticks(self, seconds: float) -> int:
+        return max(1, round(seconds / self.tick))
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        with self.lock:
+            deadline = self.current_tick + self.ticks(delay)
+            timer = Timer(deadline, callback, args, deadline % self.size)
+            self.slots[timer.slot][timer] = None
+            return timer
+
+    def cancel(self, timer: Timer):
+        with self.lock:
+            self.slots[timer.slot].pop(timer, None)
+
+    def advance(self, ticks: int = 1):
+        """Move the wheel forward and run every timer that came due, outside the lock."""
+        for _ in range(ticks):
+            with self.lock:
+                self.current_tick += 1
+                slot = self.slots[self.current_tick % self.size]
+                due = [timer for timer in slot if timer.deadline <= self.current_tick]
+                for timer in due:
+                    del slot[timer]
+
+            for timer in due:
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    print(f"Error running timer {timer.callback.__name__}: {e}")
@@ -0,0 +1,224 @@
+import os
+import socket
+import stat
+import struct
+import threading
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+UNIX_SOCKET_PATH = '/tmp/socketchat.sock'
+
+
+def remove_stale_socket(path: str, sock_type: int = socket.SOCK_STREAM):
+    """Unlink a unix socket file left behind by a dead process; refuse if someone still listens."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, sock_type)
+    try:
+        probe.connect(path)
+        raise OSError(f"Another server is already listening on {path}")
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+    finally:
+        probe.close()
+
+
+def set_send_timeout(sock, timeout: float):
+    """Make a blocking send on ``sock`` fail with BlockingIOError once the peer has not read for ``timeout`` seconds."""
+    if isinstance(sock, MemoryConnection):
+        sock._send_timeout = timeout
+        return
+    seconds = int(timeout)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                    struct.pack('@ll', seconds, int((timeout - seconds) * 1_000_000)))
+
+
+class SocketListener:
+    """Listening TCP or unix domain socket."""
+
+    def __init__(self, sock: socket.socket, address=None):
+        self.sock = sock
+        self.address = address if address is not None else sock.getsockname()
+
+    @classmethod
+    def tcp(cls, host: str, port: int) -> 'SocketListener':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        return cls(sock, (host, port))
+
+    @classmethod
+    def unix(cls, path: str) -> 'SocketListener':
+        return cls(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), path)
+
+    @property
+    def is_unix(self) -> bool:
+        return self.sock.family == getattr(socket, 'AF_UNIX', None)
+
+    def open(self):
+        if self.is_unix:
+            remove_stale_socket(self.address)
+        self.sock.bind(self.address)
+        self.sock.listen(5)
+        self.address = self.sock.getsockname()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def accept(self, timeout: float) -> Tuple[socket.socket, object]:
+        self.sock.settimeout(timeout)
+        client_socket, client_address = self.sock.accept()
+        client_socket.settimeout(None)
+        if not self.is_unix:
+            # Frames go out in a single write, so Nagle only adds delay.
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return client_socket, client_address or f"unix:{self.address}"
+
+    def wake(self):
+        pass
+
+    def close(self, unlink: bool = True):
+        if self.is_unix and unlink and self.sock.fileno() >= 0:
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
+        self.sock.close()
+
+    def __str__(self):
+        if self.is_unix:
+            return f"unix:{self.address}"
+        return f"{self.address[0]}:{self.address[1]}"
+
+
+class MemoryConnection:
+    """One end of an in-process byte stream with the socket calls the chat code uses.
+
+    Sends append straight to the peer's buffer, so bots and tests running in
+    the server process speak the normal framed protocol without any syscalls.
+    Like a socket, a send waits while the peer has HIGH_WATER bytes unread.
+    """
+
+    HIGH_WATER = 256 * 1024
+
+    def __init__(self):
+        self.peer: Optional['MemoryConnection'] = None
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._eof = False
+        self._closed = False
+        self._timeout: Optional[float] = None
+        self._send_timeout: Optional[float] = None
+
+    @classmethod
+    def pair(cls) -> Tuple['MemoryConnection', 'MemoryConnection']:
+        a, b = cls(), cls()
+        a.peer, b.peer = b, a
+        return a, b
+
+    def _feed(self, data: bytes, timeout: Optional[float] = None):
+        with self._cond:
+            def has_room():
+                return len(self._buffer) < self.HIGH_WATER or self._eof or self._closed
+
+            if not has_room() and (timeout == 0 or not self._cond.wait_for(has_room, timeout)):
+                raise BlockingIOError("Memory connection buffer is full")
+            if self._eof or self._closed:
+                raise BrokenPipeError("Memory connection closed")
+            self._buffer += data
+            self._cond.notify_all()
+
+    def _end(self):
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def sendall(self, data: bytes):
+        if self._closed:
+            raise BrokenPipeError("Memory connection closed")
+        self.peer._feed(data, self._send_timeout)
+
+    def send(self, data: bytes, flags: int = 0) -> int:
+        if self._closed:
+            raise BrokenPipeError("Memory connection closed")
+        nowait = flags & getattr(socket, 'MSG_DONTWAIT', 0)
+        self.peer._feed(data, 0 if nowait else self._send_timeout)
+        return len(data)
+
+    def recv(self, size: int) -> bytes:
+        with self._cond:
+            if self._closed:
+                raise OSError("Memory connection closed")
+            if not self._buffer and not self._eof:
+                if not self._cond.wait_for(lambda: self._buffer or self._eof, self._timeout):
+                    raise socket.timeout("timed out")
+            chunk = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._cond.notify_all()
+            return chunk
+
+    def settimeout(self, timeout: Optional[float]):
+        self._timeout = timeout
+
+    def shutdown(self, how: int = socket.SHUT_RDWR):
+        if how != socket.SHUT_WR:
+            self._end()
+        if how != socket.SHUT_RD:
+            self.peer._end()
+
+    def close(self):
+        self._closed = True
+        self.shutdown()
+
+    def fileno(self) -> int:
+        return -1
+
+    def getpeername(self) -> str:
+        return 'memory'
+
+
+class MemoryListener:
+    """Accepts in-process MemoryConnections handed out by ``connect``."""
+
+    def __init__(self):
+        self._pending: Deque[MemoryConnection] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def open(self):
+        self._closed = False
+
+    def connect(self) -> MemoryConnection:
+        client_end, server_end = MemoryConnection.pair()
+        with self._cond:
+            if self._closed:
+                raise ConnectionRefusedError("Memory listener is closed")
+            self._pending.append(server_end)
+            self._cond.notify()
+        return client_end
+
+    def fileno(self) -> int:
+        return -1
+
+    def accept(self, timeout: float) -> Tuple[MemoryConnection, str]:
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            if not self._pending:
+                raise socket.timeout("timed out")
+            return self._pending.popleft(), 'memory'
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self, unlink: bool = True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __str__(self):
+        return 'memory'